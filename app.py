@@ -1,15 +1,35 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from starlette.background import BackgroundTask
 from fastapi.middleware.cors import CORSMiddleware
 import os
+import logging
 import tempfile
-import subprocess
 import zipfile
-from typing import Optional
+from zipstream import ZipStream
+from typing import BinaryIO, Optional
 import uvicorn
 import shutil
 import asyncio
+import uuid
+import signal
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
+from urllib.parse import quote
+
+# uvicorn only configures its own loggers, so this one needs a handler of its own
+log = logging.getLogger("spleeter_api")
+log.setLevel(os.environ.get("LOG_LEVEL", "INFO").upper())
+log_handler = logging.StreamHandler()
+log_handler.setFormatter(logging.Formatter("%(levelname)s:     %(message)s"))
+log.addHandler(log_handler)
+log.propagate = False
+
+ALLOWED_EXTENSIONS = {'mp3', 'wav', 'flac', 'm4a', 'ogg'}
+MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB (reduced for Render free tier)
+MAX_REQUEST_SIZE = MAX_FILE_SIZE + 1024 * 1024  # File plus multipart framing and form fields
 
 app = FastAPI(
     title="Spleeter Audio Separation API",
@@ -17,6 +37,25 @@ app = FastAPI(
     version="1.0.0"
 )
 
+class LimitUploadSize:
+    """ASGI middleware that rejects oversized uploads from Content-Length before the body is read"""
+    
+    def __init__(self, app, max_size: int):
+        self.app = app
+        self.max_size = max_size
+    
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            content_length = dict(scope["headers"]).get(b"content-length", b"")
+            if content_length.isdigit() and int(content_length) > self.max_size:
+                response = JSONResponse(status_code=413, content={"detail": "File too large (max 25MB)"})
+                await response(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+# Added before CORS so that CORS wraps it and the 413 is readable from the browser
+app.add_middleware(LimitUploadSize, max_size=MAX_REQUEST_SIZE)
+
 # Add CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -26,12 +65,80 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
-ALLOWED_EXTENSIONS = {'mp3', 'wav', 'flac', 'm4a', 'ogg'}
-MAX_FILE_SIZE = 25 * 1024 * 1024  # 25MB (reduced for Render free tier)
+UPLOAD_CHUNK_SIZE = 1 << 20  # 1MB
+ZIP_READ_SIZE = 1 << 20  # 1MB (zipstream reads 64KB at a time by default)
+ZIP_COMPRESSION = os.environ.get("ZIP_COMPRESSION", "stored").lower()  # "stored" or "deflate"
+SPLEETER_TIMEOUT = 300  # 5 minute timeout for Render
+PROBE_TIMEOUT = 30
+SPLEETER_SAMPLE_RATE = 44100  # The "16kHz" models cut bandwidth, they still run at 44.1kHz
+SPLEETER_MAX_DURATION = 600  # Seconds of audio separated per file (Spleeter's default)
+STEM_NAMES = {
+    2: ('vocals', 'accompaniment'),
+    4: ('vocals', 'drums', 'bass', 'other'),
+    5: ('vocals', 'drums', 'bass', 'piano', 'other')
+}
+STEM_OPTIONS = tuple(STEM_NAMES)
+
+# Spleeter runs in persistent worker processes that load TensorFlow and the
+# models once, before taking any requests, and reuse them. Each worker holds its
+# own TF session (~500MB), so size the pool to the available RAM. Workers come
+# from a forkserver rather than being forked from the API process, which has
+# threads running by the time they start.
+SPLEETER_WORKERS = int(os.environ.get("SPLEETER_WORKERS", 1))
+WORKER_RETRY_DELAY = 30  # Seconds between attempts to start a failed worker
+WORKER_WAIT_TIMEOUT = SPLEETER_TIMEOUT  # Longest a request waits for a worker before a 503
+SEPARATORS = {}
+MP_CONTEXT = multiprocessing.get_context("forkserver")
+
+# A request takes an idle worker for the duration of its separation, so
+# separations beyond SPLEETER_WORKERS wait their turn in the API process and
+# queued requests don't count against the timeout
+IDLE_WORKERS: Optional[asyncio.Queue] = None  # Created on startup
+ALL_WORKERS = set()
+BACKGROUND_TASKS = set()
+
+# Prefer RAM-backed storage for intermediate files when there is room for it.
+# A request's files stay until its response has been downloaded, and queued
+# requests already hold their upload, so the number of requests with files on
+# disk isn't bounded by SPLEETER_WORKERS. Each request is placed on its own:
+# in /dev/shm only while it has room for the worst case (a maximum size upload
+# plus five 16-bit stereo WAV stems of SPLEETER_MAX_DURATION, ~530MB) for it
+# and for every request already there, otherwise on disk.
+SHM_DIR = Path("/dev/shm")
+MAX_STEM_SIZE = SPLEETER_MAX_DURATION * SPLEETER_SAMPLE_RATE * 2 * 2
+MAX_WORK_DIR_SIZE = MAX_FILE_SIZE + max(map(len, STEM_NAMES.values())) * MAX_STEM_SIZE
+SHM_WORK_DIRS = set()  # Request directories currently in /dev/shm
+
+def get_shm_temp_dir() -> Optional[Path]:
+    """Create the /dev/shm temp directory if /dev/shm is writable"""
+    if not os.access(SHM_DIR, os.W_OK):
+        return None
+    try:
+        shm_temp_dir = SHM_DIR / "spleeter_api"
+        shm_temp_dir.mkdir(exist_ok=True)
+        return shm_temp_dir
+    except OSError:
+        return None
+
+# Directories for storing temporary files
+SHM_TEMP_DIR = get_shm_temp_dir()
+DISK_TEMP_DIR = Path(tempfile.gettempdir()) / "spleeter_api"
+DISK_TEMP_DIR.mkdir(exist_ok=True)
 
-# Directory for storing temporary files
-TEMP_DIR = Path(tempfile.gettempdir()) / "spleeter_api"
-TEMP_DIR.mkdir(exist_ok=True)
+def new_work_dir() -> Path:
+    """Pick a request's temp directory, in /dev/shm if it has room for one more worst case"""
+    name = uuid.uuid4().hex
+    if SHM_TEMP_DIR is not None:
+        try:
+            free = shutil.disk_usage(SHM_TEMP_DIR).free
+        except OSError:
+            free = 0
+        # Conservative: space already used by requests in /dev/shm is counted twice
+        if free >= (len(SHM_WORK_DIRS) + 1) * MAX_WORK_DIR_SIZE:
+            work_dir = SHM_TEMP_DIR / name
+            SHM_WORK_DIRS.add(work_dir)
+            return work_dir
+    return DISK_TEMP_DIR / name
 
 def validate_audio_file(file: UploadFile):
     if not file.filename:
@@ -44,35 +151,153 @@ def validate_audio_file(file: UploadFile):
             detail=f"File type '{extension}' not allowed. Allowed types: {', '.join(ALLOWED_EXTENSIONS)}"
         )
 
-async def cleanup_file(file_path: str, delay: int = 60):
-    """Clean up a file after a delay"""
-    await asyncio.sleep(delay)
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-            print(f"Cleaned up file: {file_path}")
-        # Also clean up the parent directory if it's empty
-        parent_dir = os.path.dirname(file_path)
-        if os.path.exists(parent_dir) and not os.listdir(parent_dir):
-            os.rmdir(parent_dir)
-            print(f"Cleaned up empty directory: {parent_dir}")
-    except Exception as e:
-        print(f"Failed to cleanup {file_path}: {e}")
+def init_spleeter():
+    """Load a Spleeter separator per stem count in a worker process"""
+    # Keep TensorFlow's info/warning chatter out of the logs
+    os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "2")
+    from spleeter.separator import Separator
+    for n in STEM_OPTIONS:
+        SEPARATORS[n] = Separator(f"spleeter:{n}stems-16kHz", multiprocess=False)
 
-class CustomFileResponse(FileResponse):
-    """FileResponse that schedules file cleanup after serving"""
+def warm_up_spleeter():
+    """
+    Separate a second of silence with each model (runs in a worker process)
     
-    def __init__(self, *args, cleanup_path: str = None, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.cleanup_path = cleanup_path
+    Separator() only reads its configuration; the TF graph is built and the
+    model downloaded and loaded on first use. Doing that here keeps it out of
+    the first request's timeout.
+    """
+    import numpy as np
+    silence = np.zeros((SPLEETER_SAMPLE_RATE, 2), dtype=np.float32)
+    for separator in SEPARATORS.values():
+        separator.separate(silence)
+
+class SpleeterWorker:
+    """One Spleeter worker process, so a stuck job can be killed without touching other requests"""
     
-    async def __call__(self, scope, receive, send):
+    def __init__(self):
+        self.executor = ProcessPoolExecutor(max_workers=1, initializer=init_spleeter, mp_context=MP_CONTEXT)
+        self.pid: Optional[int] = None
+    
+    async def start(self):
+        """Start the worker process, record its pid and load the models"""
+        self.pid = await self.run(os.getpid)
+        await self.run(warm_up_spleeter)
+    
+    async def run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, fn, *args)
+    
+    def kill(self):
+        """Kill the worker process, abandoning whatever it is running"""
+        if self.pid is not None:
+            try:
+                os.kill(self.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+async def add_spleeter_worker():
+    """Start a worker, retrying until it comes up, and make it available to requests"""
+    while True:
+        worker = SpleeterWorker()
+        ALL_WORKERS.add(worker)
         try:
-            await super().__call__(scope, receive, send)
-        finally:
-            # Schedule cleanup after response is sent
-            if self.cleanup_path:
-                asyncio.create_task(cleanup_file(self.cleanup_path))
+            await worker.start()
+            break
+        except Exception as e:
+            log.warning("Spleeter worker failed to start: %s", e)
+            ALL_WORKERS.discard(worker)
+            worker.kill()
+            await asyncio.sleep(WORKER_RETRY_DELAY)
+    IDLE_WORKERS.put_nowait(worker)
+
+def start_spleeter_worker():
+    """Start a worker in the background"""
+    task = asyncio.create_task(add_spleeter_worker())
+    BACKGROUND_TASKS.add(task)
+    task.add_done_callback(BACKGROUND_TASKS.discard)
+
+def release_spleeter_worker(worker: SpleeterWorker, reusable: bool):
+    """Return a worker to the idle queue, or kill it and start a replacement"""
+    if reusable:
+        IDLE_WORKERS.put_nowait(worker)
+        return
+    ALL_WORKERS.discard(worker)
+    worker.kill()
+    start_spleeter_worker()
+
+def separate_file(stems: int, input_path: str, output_dir: str) -> list:
+    """
+    Run a warm Spleeter separator on a file (runs in a worker process)
+    
+    Returns (path, arcname, size) for the stems written, listed here while
+    they are still in this process's page cache.
+    """
+    SEPARATORS[stems].separate_to_file(
+        input_path, output_dir, codec='wav', duration=SPLEETER_MAX_DURATION, synchronous=True
+    )
+    
+    # The model determines exactly which stems are written, so a single
+    # directory listing is enough to check them
+    track_dir = os.path.join(output_dir, Path(input_path).stem)
+    with os.scandir(track_dir) as entries:
+        written = {entry.name: entry.stat().st_size for entry in entries}
+    
+    expected = [f'{name}.wav' for name in STEM_NAMES[stems]]
+    missing = [name for name in expected if name not in written]
+    if missing:
+        raise RuntimeError(f"Missing stems in output: {', '.join(missing)}")
+    
+    return [(os.path.join(track_dir, name), name, written[name]) for name in expected]
+
+def read_chunks(file_path: str, chunk_size: int = ZIP_READ_SIZE):
+    """Yield a file's contents in large chunks"""
+    with open(file_path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+async def probe_audio(input_path: Path):
+    """Reject files ffmpeg can't read before they reach a Spleeter worker"""
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'error',
+        '-select_streams', 'a:0', '-show_entries', 'stream=codec_type', '-of', 'csv=p=0',
+        str(input_path),
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE
+    )
+    try:
+        stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=PROBE_TIMEOUT)
+    except asyncio.TimeoutError:
+        process.kill()
+        await process.wait()
+        raise
+    
+    if process.returncode != 0 or not stdout.strip():
+        reason = stderr.decode(errors='replace')[-500:] or "no audio stream found"
+        raise HTTPException(status_code=400, detail=f"Could not read audio file: {reason}")
+
+def save_upload(source: BinaryIO, input_path: Path):
+    """Copy the spooled upload to disk through a single reused buffer"""
+    with open(input_path, 'wb') as f:
+        shutil.copyfileobj(source, f, UPLOAD_CHUNK_SIZE)
+
+def create_work_dir(work_dir: Path):
+    """Create a request's temp directory and its output subdirectory"""
+    (work_dir / 'output').mkdir(parents=True)
+
+def attachment_header(filename: str) -> str:
+    """Content-Disposition for a download, encoded the way Starlette's FileResponse does it"""
+    quoted = quote(filename)
+    if quoted != filename:
+        return f"attachment; filename*=utf-8''{quoted}"
+    return f'attachment; filename="{filename}"'
+
+def cleanup_dir(dir_path: Path):
+    """Remove a request's temp directory"""
+    shutil.rmtree(dir_path, ignore_errors=True)
+    SHM_WORK_DIRS.discard(dir_path)
+    log.debug("Cleaned up directory: %s", dir_path)
 
 @app.get("/")
 async def root():
@@ -90,151 +315,128 @@ async def health_check():
 @app.post("/separate")
 async def separate_audio(
     audio: UploadFile = File(...),
-    stems: Optional[int] = Form(2)
+    stems: Optional[int] = Form(2),
+    stem: Optional[str] = None
 ):
     """
     Separate audio into stems
     
     - **audio**: Audio file to separate (mp3, wav, flac, m4a, ogg)
     - **stems**: Number of stems (2, 4, or 5)
+    - **stem**: Optional query parameter to return just this stem as a WAV instead of a zip (e.g. vocals)
     """
     
     # Validate inputs
     validate_audio_file(audio)
     
-    if stems not in [2, 4, 5]:
+    if stems not in STEM_OPTIONS:
         raise HTTPException(status_code=400, detail="Stems must be 2, 4, or 5")
     
-    # Check file size
-    contents = await audio.read()
-    if len(contents) > MAX_FILE_SIZE:
+    if stem is not None and stem not in STEM_NAMES[stems]:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Stem '{stem}' not available for {stems} stems. Available stems: {', '.join(STEM_NAMES[stems])}"
+        )
+    
+    # Starlette records the size when it spools the upload
+    if audio.size > MAX_FILE_SIZE:
         raise HTTPException(status_code=413, detail="File too large (max 25MB)")
     
-    # Create unique temporary directory that won't be auto-cleaned
-    import uuid
-    unique_id = str(uuid.uuid4())
-    temp_dir = TEMP_DIR / unique_id
-    temp_dir.mkdir(exist_ok=True)
+    # Each request gets its own temp directory, removed once the response is sent
+    work_dir = new_work_dir()
+    output_dir = work_dir / 'output'
     
     try:
-        # Save uploaded file
-        input_path = temp_dir / audio.filename
-        with open(input_path, 'wb') as f:
-            f.write(contents)
+        # Filesystem calls run off the event loop so other requests aren't blocked
+        await asyncio.to_thread(create_work_dir, work_dir)
         
-        print(f"Input file saved: {input_path}")
-        print(f"File size: {input_path.stat().st_size} bytes")
+        # Copy the spooled upload straight to disk
+        extension = audio.filename.split('.')[-1].lower()
+        input_path = work_dir / f'input.{extension}'
+        await audio.seek(0)
+        await asyncio.to_thread(save_upload, audio.file, input_path)
         
-        # Create output directory
-        output_dir = temp_dir / 'output'
-        output_dir.mkdir(exist_ok=True)
+        log.debug("Input file saved: %s (%d bytes)", input_path, audio.size)
         
-        # Run Spleeter with timeout for Render
-        model = f"spleeter:{stems}stems-16kHz"
-        cmd = [
-            'spleeter', 'separate',
-            '-p', model,
-            '-o', str(output_dir),
-            str(input_path)
-        ]
+        # Spleeter decodes the upload itself; a quick probe turns unreadable
+        # files into a 400 without tying up a worker
+        await probe_audio(input_path)
         
-        print(f"Running command: {' '.join(cmd)}")
-        
-        # Add timeout to prevent hanging on Render
-        result = subprocess.run(
-            cmd, 
-            capture_output=True, 
-            text=True,
-            timeout=300  # 5 minute timeout
-        )
-        
-        print(f"Spleeter return code: {result.returncode}")
-        print(f"Spleeter stdout: {result.stdout}")
-        print(f"Spleeter stderr: {result.stderr}")
+        # Run Spleeter with timeout for Render
+        log.debug("Separating %s into %d stems", input_path, stems)
         
-        if result.returncode != 0:
-            raise HTTPException(
-                status_code=500,
-                detail=f"Spleeter processing failed: {result.stderr}"
+        # Bounded so requests don't hang if workers can't start at all
+        try:
+            worker = await asyncio.wait_for(IDLE_WORKERS.get(), timeout=WORKER_WAIT_TIMEOUT)
+        except asyncio.TimeoutError:
+            raise HTTPException(status_code=503, detail="No Spleeter worker available - try again later")
+        # A worker is only reused if its job finished. After a timeout or a
+        # cancelled request it is still busy, so it is killed rather than left
+        # to block the requests queued behind it.
+        reusable = False
+        try:
+            stem_files = await asyncio.wait_for(
+                worker.run(separate_file, stems, str(input_path), str(output_dir)),
+                timeout=SPLEETER_TIMEOUT
             )
+            reusable = True
+        except asyncio.TimeoutError:
+            raise
+        except Exception as e:
+            reusable = not isinstance(e, BrokenProcessPool)
+            raise HTTPException(status_code=500, detail=f"Spleeter processing failed: {e}")
+        finally:
+            release_spleeter_worker(worker, reusable)
         
-        # Debug: List all files in output directory
-        print(f"Contents of output directory {output_dir}:")
-        for root, dirs, files in os.walk(output_dir):
-            level = root.replace(str(output_dir), '').count(os.sep)
-            indent = ' ' * 2 * level
-            print(f"{indent}{Path(root).name}/")
-            subindent = ' ' * 2 * (level + 1)
-            for file in files:
-                print(f"{subindent}{file}")
-        
-        # Create zip file with all tracks
+        log.debug("Found %d audio files", len(stem_files))
         base_name = Path(audio.filename).stem
-        track_dir = output_dir / base_name
-        
-        print(f"Looking for track directory: {track_dir}")
-        print(f"Track directory exists: {track_dir.exists()}")
-        
-        if not track_dir.exists():
-            # Try to find the actual output directory
-            subdirs = [d for d in output_dir.iterdir() if d.is_dir()]
-            if subdirs:
-                track_dir = subdirs[0]
-                print(f"Using alternative track directory: {track_dir}")
-            else:
-                raise HTTPException(status_code=500, detail=f"No output tracks found. Expected: {track_dir}")
-        
-        # Check if there are any audio files in the track directory
-        audio_files = []
-        for root, dirs, files in os.walk(track_dir):
-            for file in files:
-                if file.lower().endswith(('.wav', '.mp3', '.flac')):
-                    audio_files.append(Path(root) / file)
         
-        if not audio_files:
-            raise HTTPException(status_code=500, detail="No audio files found in output directory")
-        
-        print(f"Found {len(audio_files)} audio files")
-        
-        zip_path = temp_dir / f'{base_name}_separated.zip'
-        
-        print(f"Creating zip file: {zip_path}")
-        
-        with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-            for root, dirs, files in os.walk(track_dir):
-                for file in files:
-                    file_path = Path(root) / file
-                    arcname = file_path.relative_to(track_dir)
-                    zipf.write(file_path, arcname)
-                    print(f"Added to zip: {arcname}")
+        # A single requested stem is sent as-is, skipping the archive entirely
+        if stem is not None:
+            file_path = next(path for path, arcname, size in stem_files if arcname == f'{stem}.wav')
+            return FileResponse(
+                file_path,
+                media_type='audio/wav',
+                filename=f'{base_name}_{stem}.wav',
+                background=BackgroundTask(cleanup_dir, work_dir)  # Clean up once the file is sent
+            )
         
-        print(f"Zip file created: {zip_path.exists()}")
-        print(f"Zip file size: {zip_path.stat().st_size if zip_path.exists() else 'N/A'}")
+        # Build the zip while it is being sent instead of writing it to disk first.
+        # Stems are stored uncompressed by default: WAV barely deflates and the CPU cost
+        # isn't worth it, and with known sizes the final length can be sent up front.
+        # Deployments short on bandwidth can opt into a fast level 1 deflate instead.
+        deflate = ZIP_COMPRESSION == "deflate"
+        zs = ZipStream(
+            compress_type=zipfile.ZIP_DEFLATED if deflate else zipfile.ZIP_STORED,
+            compress_level=1 if deflate else None,
+            sized=not deflate
+        )
+        for file_path, arcname, size in stem_files:
+            zs.add(read_chunks(file_path), arcname, size=size)
         
-        if not zip_path.exists():
-            raise HTTPException(status_code=500, detail="Failed to create zip file")
+        # Filenames outside latin-1 can't go into a header as-is
+        headers = {'Content-Disposition': attachment_header(f'{base_name}_separated.zip')}
+        if zs.sized:
+            headers['Content-Length'] = str(len(zs))
         
-        return CustomFileResponse(
-            str(zip_path),
+        return StreamingResponse(
+            iter(zs),
             media_type='application/zip',
-            filename=f'{base_name}_separated.zip',
-            cleanup_path=str(temp_dir)  # Schedule cleanup of entire temp directory
+            headers=headers,
+            background=BackgroundTask(cleanup_dir, work_dir)  # Clean up once the zip is sent
         )
         
-    except subprocess.TimeoutExpired:
+    except asyncio.TimeoutError:
         # Clean up on timeout
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
+        await asyncio.to_thread(cleanup_dir, work_dir)
         raise HTTPException(status_code=408, detail="Processing timeout - file may be too large")
     except HTTPException:
         # Clean up on HTTP exceptions
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
+        await asyncio.to_thread(cleanup_dir, work_dir)
         raise
     except Exception as e:
         # Clean up on other exceptions
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
+        await asyncio.to_thread(cleanup_dir, work_dir)
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/models")
@@ -260,21 +462,42 @@ async def get_available_models():
         ]
     }
 
+def cleanup_old_dirs():
+    """Remove temp directories left over from previous runs"""
+    try:
+        for temp_dir in (SHM_TEMP_DIR, DISK_TEMP_DIR):
+            if temp_dir is not None and temp_dir.exists():
+                for item in temp_dir.iterdir():
+                    if item.is_dir():
+                        # Remove directories older than 1 hour
+                        import time
+                        if time.time() - item.stat().st_mtime > 3600:
+                            shutil.rmtree(item)
+                            log.info("Cleaned up old directory: %s", item)
+    except Exception as e:
+        log.warning("Startup cleanup failed: %s", e)
+
 # Cleanup task that runs periodically to remove old files
 @app.on_event("startup")
 async def startup_cleanup():
     """Clean up any leftover temporary files on startup"""
-    try:
-        if TEMP_DIR.exists():
-            for item in TEMP_DIR.iterdir():
-                if item.is_dir():
-                    # Remove directories older than 1 hour
-                    import time
-                    if time.time() - item.stat().st_mtime > 3600:
-                        shutil.rmtree(item)
-                        print(f"Cleaned up old directory: {item}")
-    except Exception as e:
-        print(f"Startup cleanup failed: {e}")
+    await asyncio.to_thread(cleanup_old_dirs)
+
+@app.on_event("startup")
+async def start_spleeter_workers():
+    """Start the Spleeter workers; requests queue until one is ready"""
+    global IDLE_WORKERS
+    IDLE_WORKERS = asyncio.Queue()
+    for _ in range(SPLEETER_WORKERS):
+        start_spleeter_worker()
+
+@app.on_event("shutdown")
+async def shutdown_spleeter():
+    """Stop the Spleeter worker processes"""
+    for task in list(BACKGROUND_TASKS):
+        task.cancel()
+    for worker in ALL_WORKERS:
+        worker.kill()
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))